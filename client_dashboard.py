@@ -2,7 +2,11 @@ import streamlit as st
 from streamlit_lottie import st_lottie
 import pandas as pd
 import sqlite3
+import threading
+import os
 import requests
+import io
+import zipfile
 from datetime import date
 
 # -----------------------------------------------------------------------------
@@ -24,12 +28,45 @@ st.markdown(
 
 DB_PATH = "client_data.db"
 
+# o sqlite3 guarda os statements preparados por texto da query; com a conexão
+# cacheada, reaproveitar as mesmas strings pula o parse a cada submit
+INSERT_CLIENTE = "INSERT INTO clientes (nome,email,telefone) VALUES (?,?,?)"
+INSERT_CARRO = "INSERT INTO carros (cliente_id,modelo,placa) VALUES (?,?,?)"
+INSERT_ORCAMENTO = "INSERT INTO orcamentos (cliente_id,descricao,valor) VALUES (?,?,?)"
+INSERT_STATUS = "INSERT INTO status (cliente_id,status_atual,data_atualizacao) VALUES (?,?,?)"
+INSERT_ENTREGA = "INSERT INTO entregas (cliente_id,data_entrega) VALUES (?,?)"
+
 # -----------------------------------------------------------------------------
 # Banco de dados
 # -----------------------------------------------------------------------------
 
+@st.cache_resource
+def get_conn():
+    """Conexão única reaproveitada entre reruns do Streamlit."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(
+        """
+        PRAGMA journal_mode=WAL;
+        PRAGMA synchronous=NORMAL;
+        PRAGMA temp_store=MEMORY;
+        PRAGMA cache_size=-32000;
+        PRAGMA busy_timeout=5000;
+        PRAGMA mmap_size=268435456;
+        """
+    )
+    return conn
+
+
+@st.cache_resource
+def get_lock():
+    """Serializa as escritas: a conexão é compartilhada entre as threads das sessões."""
+    return threading.Lock()
+
+
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
+    conn = get_conn()
+    with get_lock(), conn:
         cur = conn.cursor()
         cur.execute("""CREATE TABLE IF NOT EXISTS clientes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -64,35 +101,110 @@ def init_db():
                 data_entrega DATE,
                 FOREIGN KEY(cliente_id) REFERENCES clientes(id)
         )""")
-        conn.commit()
+        # as páginas sempre filtram por cliente; sem índice cada leitura varre a tabela
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_carros_cliente ON carros(cliente_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_orcamentos_cliente ON orcamentos(cliente_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_status_cliente ON status(cliente_id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_entregas_cliente ON entregas(cliente_id)")
+
+
+def db_mtime():
+    """Última modificação do banco (inclui o arquivo -wal, onde caem as escritas em WAL)."""
+    return max(os.path.getmtime(p) for p in (DB_PATH, DB_PATH + "-wal") if os.path.exists(p))
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def load_table(sql, params=(), mtime=0):
+    """Leitura cacheada; `mtime` entra na chave para invalidar quando o banco muda.
+
+    Colunas já saem em dtypes pyarrow, que o st.dataframe envia sem reconverter.
+    """
+    return pd.read_sql_query(sql, get_conn(), params=params, dtype_backend="pyarrow")
+
+
+def fast_read(sql, params=()):
+    """DataFrame direto do cursor, sem passar pelo caminho genérico do read_sql."""
+    cur = get_conn().execute(sql, params)
+    cols = [d[0] for d in cur.description]
+    return pd.DataFrame.from_records(cur.fetchall(), columns=cols)
 
 # -----------------------------------------------------------------------------
 # Utilidades
 # -----------------------------------------------------------------------------
 
+@st.cache_data(ttl=86400, show_spinner=False)
+def _baixar_lottie(url: str):
+    # exceções não são cacheadas, então uma falha de rede é tentada de novo no próximo rerun
+    r = requests.get(url, timeout=5)
+    r.raise_for_status()
+    return r.json()
+
+
 def carregar_lottie(url: str):
     try:
-        r = requests.get(url, timeout=5)
-        if r.status_code == 200:
-            return r.json()
+        return _baixar_lottie(url)
     except Exception:
-        pass
-    return None
+        return None
+
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def opcoes_clientes(_conn, mtime):
+    """Mapa label -> id do seletor, compartilhado entre sessões e refeito quando o banco muda."""
+    # NULLIF cobre o telefone vazio que o text_input grava quando não é preenchido
+    rows = _conn.execute(
+        "SELECT id, nome, COALESCE(NULLIF(telefone, ''), 'sem telefone') FROM clientes"
+    ).fetchall()
+    return {f"{nome} — {telefone}": cid for cid, nome, telefone in rows}
 
 
 def selecionar_cliente(conn):
     """Devolve (id, nome). Se não houver clientes, mostra aviso e retorna (None, "")."""
-    clientes = pd.read_sql_query("SELECT id, nome, telefone FROM clientes", conn)
-    if clientes.empty:
+    opcoes = opcoes_clientes(conn, db_mtime())
+    if not opcoes:
         st.warning("Nenhum cliente cadastrado. Adicione clientes primeiro.")
         return None, ""
 
-    opcoes = {
-        f"{row.nome} — {row.telefone or 'sem telefone'}": row.id for row in clientes.itertuples()
-    }
     label = st.selectbox("Selecione o cliente", opcoes.keys())
     return opcoes[label], label.split(" — ")[0]
 
+
+def tabelas_exportacao():
+    """Nome da aba/arquivo -> DataFrame de cada tabela exportada."""
+    return {
+        "Clientes": fast_read("SELECT id, nome, email, telefone FROM clientes"),
+        "Carros": fast_read("SELECT id, cliente_id, modelo, placa FROM carros"),
+        "Orcamentos": fast_read("SELECT id, cliente_id, descricao, valor FROM orcamentos"),
+        "Status": fast_read("SELECT id, cliente_id, status_atual, data_atualizacao FROM status"),
+        "Entregas": fast_read("SELECT id, cliente_id, data_entrega FROM entregas"),
+    }
+
+
+def gerar_excel(tabelas):
+    """Monta o .xlsx em memória, uma aba por tabela."""
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter", engine_kwargs={"options": {"strings_to_urls": False}}) as writer:
+        for nome, df in tabelas.items():
+            df.to_excel(writer, sheet_name=nome, index=False)
+    return buf.getvalue()
+
+
+def gerar_parquet(tabelas):
+    """Um .parquet por tabela dentro de um .zip; o parquet já é comprimido, então o zip só agrupa."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+        for nome, df in tabelas.items():
+            parquet = io.BytesIO()
+            df.to_parquet(parquet, compression="zstd", index=False)
+            zf.writestr(f"{nome.lower()}.parquet", parquet.getvalue())
+    return buf.getvalue()
+
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def gerar_exportacao(mtime):
+    """(xlsx, zip de parquet) a partir de uma única leitura; refeito só quando o banco muda."""
+    tabelas = tabelas_exportacao()
+    return gerar_excel(tabelas), gerar_parquet(tabelas)
+
 # -----------------------------------------------------------------------------
 # Páginas
 # -----------------------------------------------------------------------------
@@ -107,137 +219,152 @@ def pagina_inicio():
 
 def pagina_clientes():
     st.subheader("📇 Clientes")
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        with st.form("frm_cliente", clear_on_submit=True):
-            col1, col2, col3 = st.columns(3)
-            nome = col1.text_input("Nome")
-            email = col2.text_input("Email")
-            telefone = col3.text_input("Telefone")
-            if st.form_submit_button("Adicionar"):
-                if nome.strip():
-                    cur.execute("INSERT INTO clientes (nome,email,telefone) VALUES (?,?,?)", (nome,email,telefone))
-                    conn.commit()
-                    st.success("Cliente adicionado!")
-                else:
-                    st.error("O nome é obrigatório.")
-
-        st.divider()
-        clientes = pd.read_sql_query("SELECT * FROM clientes", conn)
-        st.dataframe(clientes, use_container_width=True)
+    conn = get_conn()
+    with st.form("frm_cliente", clear_on_submit=True):
+        col1, col2, col3 = st.columns(3)
+        nome = col1.text_input("Nome")
+        email = col2.text_input("Email")
+        telefone = col3.text_input("Telefone")
+        if st.form_submit_button("Adicionar"):
+            if nome.strip():
+                with get_lock(), conn:
+                    conn.execute(INSERT_CLIENTE, (nome,email,telefone))
+                load_table.clear()
+                opcoes_clientes.clear()
+                st.success("Cliente adicionado!")
+            else:
+                st.error("O nome é obrigatório.")
+
+    st.divider()
+    clientes = load_table("SELECT id, nome, email, telefone FROM clientes", mtime=db_mtime())
+    st.dataframe(clientes, use_container_width=True, hide_index=True)
 
 
 def pagina_carros():
     st.subheader("🚙 Veículos")
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cliente_id, _ = selecionar_cliente(conn)
-        if cliente_id is None:
-            return
-
-        with st.form("frm_carro", clear_on_submit=True):
-            col1, col2 = st.columns(2)
-            modelo = col1.text_input("Modelo")
-            placa = col2.text_input("Placa")
-            if st.form_submit_button("Registrar"):
-                if modelo.strip() and placa.strip():
-                    cur.execute("INSERT INTO carros (cliente_id,modelo,placa) VALUES (?,?,?)", (cliente_id,modelo,placa))
-                    conn.commit()
-                    st.success("Carro registrado!")
-                else:
-                    st.error("Preencha modelo e placa.")
-
-        st.divider()
-        carros = pd.read_sql_query("SELECT id, modelo, placa FROM carros WHERE cliente_id = ?", conn, params=(cliente_id,))
-        st.dataframe(carros, use_container_width=True)
+    conn = get_conn()
+    cliente_id, _ = selecionar_cliente(conn)
+    if cliente_id is None:
+        return
+
+    with st.form("frm_carro", clear_on_submit=True):
+        col1, col2 = st.columns(2)
+        modelo = col1.text_input("Modelo")
+        placa = col2.text_input("Placa")
+        if st.form_submit_button("Registrar"):
+            if modelo.strip() and placa.strip():
+                with get_lock(), conn:
+                    conn.execute(INSERT_CARRO, (cliente_id,modelo,placa))
+                load_table.clear()
+                st.success("Carro registrado!")
+            else:
+                st.error("Preencha modelo e placa.")
+
+    st.divider()
+    carros = load_table("SELECT id, modelo, placa FROM carros WHERE cliente_id = ?", (cliente_id,), mtime=db_mtime())
+    st.dataframe(carros, use_container_width=True, hide_index=True)
 
 
 def pagina_orcamentos():
     st.subheader("💰 Orçamentos")
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cliente_id, _ = selecionar_cliente(conn)
-        if cliente_id is None:
-            return
-
-        with st.form("frm_orc", clear_on_submit=True):
-            descricao = st.text_area("Descrição")
-            valor = st.number_input("Valor", min_value=0.0, format="%.2f")
-            if st.form_submit_button("Salvar"):
-                if descricao.strip():
-                    cur.execute("INSERT INTO orcamentos (cliente_id,descricao,valor) VALUES (?,?,?)", (cliente_id,descricao,valor))
-                    conn.commit()
-                    st.success("Orçamento salvo!")
-                else:
-                    st.error("Descrição obrigatória.")
-
-        st.divider()
-        orcs = pd.read_sql_query("SELECT id, descricao, valor FROM orcamentos WHERE cliente_id = ?", conn, params=(cliente_id,))
-        st.dataframe(orcs, use_container_width=True)
+    conn = get_conn()
+    cliente_id, _ = selecionar_cliente(conn)
+    if cliente_id is None:
+        return
+
+    with st.form("frm_orc", clear_on_submit=True):
+        descricao = st.text_area("Descrição")
+        valor = st.number_input("Valor", min_value=0.0, format="%.2f")
+        if st.form_submit_button("Salvar"):
+            if descricao.strip():
+                with get_lock(), conn:
+                    conn.execute(INSERT_ORCAMENTO, (cliente_id,descricao,valor))
+                load_table.clear()
+                st.success("Orçamento salvo!")
+            else:
+                st.error("Descrição obrigatória.")
+
+    st.divider()
+    orcs = load_table("SELECT id, descricao, valor FROM orcamentos WHERE cliente_id = ?", (cliente_id,), mtime=db_mtime())
+    st.dataframe(orcs, use_container_width=True, hide_index=True)
 
 
 def pagina_status():
     st.subheader("📊 Status")
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cliente_id, _ = selecionar_cliente(conn)
-        if cliente_id is None:
-            return
-
-        with st.form("frm_status", clear_on_submit=True):
-            status_atual = st.text_input("Status atual")
-            data_atualizacao = st.date_input("Data", value=date.today())
-            if st.form_submit_button("Atualizar"):
-                if status_atual.strip():
-                    cur.execute("INSERT INTO status (cliente_id,status_atual,data_atualizacao) VALUES (?,?,?)", (cliente_id,status_atual,data_atualizacao))
-                    conn.commit()
-                    st.success("Status atualizado!")
-                else:
-                    st.error("Status obrigatório.")
-
-        st.divider()
-        df = pd.read_sql_query("SELECT status_atual, data_atualizacao FROM status WHERE cliente_id=?", conn, params=(cliente_id,))
-        st.dataframe(df, use_container_width=True)
+    conn = get_conn()
+    cliente_id, _ = selecionar_cliente(conn)
+    if cliente_id is None:
+        return
+
+    with st.form("frm_status", clear_on_submit=True):
+        status_atual = st.text_input("Status atual")
+        data_atualizacao = st.date_input("Data", value=date.today())
+        if st.form_submit_button("Atualizar"):
+            if status_atual.strip():
+                with get_lock(), conn:
+                    conn.execute(INSERT_STATUS, (cliente_id,status_atual,data_atualizacao))
+                load_table.clear()
+                st.success("Status atualizado!")
+            else:
+                st.error("Status obrigatório.")
+
+    st.divider()
+    df = load_table("SELECT status_atual, data_atualizacao FROM status WHERE cliente_id=?", (cliente_id,), mtime=db_mtime())
+    st.dataframe(df, use_container_width=True, hide_index=True)
 
 
 def pagina_entregas():
     st.subheader("✅ Entregas")
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cliente_id, _ = selecionar_cliente(conn)
-        if cliente_id is None:
-            return
+    conn = get_conn()
+    cliente_id, _ = selecionar_cliente(conn)
+    if cliente_id is None:
+        return
 
-        with st.form("frm_ent", clear_on_submit=True):
-            data_entrega = st.date_input("Data de entrega", value=date.today())
-            if st.form_submit_button("Registrar"):
-                cur.execute("INSERT INTO entregas (cliente_id,data_entrega) VALUES (?,?)", (cliente_id,data_entrega))
-                conn.commit()
-                st.success("Entrega registrada!")
+    with st.form("frm_ent", clear_on_submit=True):
+        data_entrega = st.date_input("Data de entrega", value=date.today())
+        if st.form_submit_button("Registrar"):
+            with get_lock(), conn:
+                conn.execute(INSERT_ENTREGA, (cliente_id,data_entrega))
+            load_table.clear()
+            st.success("Entrega registrada!")
 
-        st.divider()
-        ent = pd.read_sql_query("SELECT data_entrega FROM entregas WHERE cliente_id=?", conn, params=(cliente_id,))
-        st.dataframe(ent, use_container_width=True)
+    st.divider()
+    ent = load_table("SELECT data_entrega FROM entregas WHERE cliente_id=?", (cliente_id,), mtime=db_mtime())
+    st.dataframe(ent, use_container_width=True, hide_index=True)
 
 
 def pagina_exportar():
     st.subheader("📤 Exportar dados")
-    with sqlite3.connect(DB_PATH) as conn:
-        clientes = pd.read_sql_query("SELECT * FROM clientes", conn)
-        carros = pd.read_sql_query("SELECT * FROM carros", conn)
-        orcamentos = pd.read_sql_query("SELECT * FROM orcamentos", conn)
-        status = pd.read_sql_query("SELECT * FROM status", conn)
-        entregas = pd.read_sql_query("SELECT * FROM entregas", conn)
-
-    with pd.ExcelWriter("dados_exportados.xlsx") as writer:
-        clientes.to_excel(writer, sheet_name="Clientes", index=False)
-        carros.to_excel(writer, sheet_name="Carros", index=False)
-        orcamentos.to_excel(writer, sheet_name="Orcamentos", index=False)
-        status.to_excel(writer, sheet_name="Status", index=False)
-        entregas.to_excel(writer, sheet_name="Entregas", index=False)
-
-    with open("dados_exportados.xlsx", "rb") as f:
-        st.download_button("Baixar Excel", f, file_name="dados_exportados.xlsx")
+    if "export_bytes" not in st.session_state:
+        st.session_state.export_bytes = None
+        st.session_state.export_mtime = None
+
+    if st.button("Gerar arquivos"):
+        mtime = db_mtime()
+        st.session_state.export_bytes = gerar_exportacao(mtime)
+        st.session_state.export_mtime = mtime
+
+    if st.session_state.export_bytes is None:
+        st.info("Clique em \"Gerar arquivos\" para montar a exportação.")
+        return
+
+    if st.session_state.export_mtime != db_mtime():
+        st.warning("Os dados mudaram desde a última exportação; clique em \"Gerar arquivos\" novamente.")
+
+    xlsx, parquet = st.session_state.export_bytes
+    col1, col2 = st.columns(2)
+    col1.download_button(
+        "Baixar Excel",
+        xlsx,
+        file_name="dados_exportados.xlsx",
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+    col2.download_button(
+        "Baixar Parquet",
+        parquet,
+        file_name="dados_exportados_parquet.zip",
+        mime="application/zip",
+    )
 
 # -----------------------------------------------------------------------------
 # Run